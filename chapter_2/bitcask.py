@@ -1,5 +1,15 @@
 import os
+import mmap
 import struct
+from array import array
+from collections import OrderedDict
+
+# Record header: timestamp(4), key size (4), value_size(4). Compiled once so the
+# format string isn't re-parsed on every put and for every record at startup.
+HEADER = struct.Struct('>III')
+
+# The maximum number of data files kept open for reads at the same time.
+MAX_READ_HANDLES = 64
 
 class Bitcask:
 
@@ -10,13 +20,38 @@ class Bitcask:
             os.makedirs(self._dir)
             
         self._active_file = None
-        self._key_dir = {}
-        # This will hold the file which is currently open in bitcask only the current file is 
-        # kept open at any time
+        self._active_file_id = None
+        # This will hold the file which is currently open for writes in bitcask.
+        # Only this file is appended to; older files are only kept open for reads
+        # (see _read_handles below).
+        self._active_file_handle = None
+        # The offset at which the next record will be appended to the active file.
+        self._write_offset = 0
+
+        # The key directory, stored as parallel arrays (one slot per live key)
+        # instead of a dict of tuples. The arrays hold plain machine integers
+        # rather than Python objects, and each file path is stored only once.
+        # Maps key -> slot in the arrays below.
+        self._key_index = {}
+        # Which data file holds the value, as an index into _files.
+        self._file_ids = array('I')
+        # The byte offset where the value starts in that file.
+        self._offsets = array('Q')
+        # The size of the value in bytes.
+        self._sizes = array('I')
+        # Data file paths, indexed by file id.
+        self._files = []
+        # Slots left behind by deleted keys, reused by the next new key.
+        self._free_slots = []
+
+        # Read handles of recently used data files, so get doesn't reopen a file
+        # on every read. Maps file id -> file object, least recently used first.
+        self._read_handles = OrderedDict()
         
         # This is a crucial step when starting the database. We need to "re-learn"
         # all the key locations by reading the files that are already on the disk.
-        # This populates our _keydir so we know where everything is.
+        # This fills _key_index and the parallel location arrays, so we know
+        # where everything is.
         self._load_keydir() 
     
     """
@@ -31,32 +66,36 @@ class Bitcask:
     precise location of the value on disk (which file it's in, the byte
     offset where the value starts, and the size of the value).
 
-    This location information is stored as a "pointer" in the `self._keydir`
-    dictionary. If a key is found multiple times across the files (which
-    happens when a value is updated), this process correctly overwrites the
-    older pointer with the newer one, ensuring the in-memory index always
-    points to the most recent version of the value.
+    This location information is stored as a "pointer" in the key directory
+    arrays, at the slot `self._key_index` assigns to the key. If a key is
+    found multiple times across the files (which happens when a value is
+    updated), this process correctly overwrites the older pointer with the
+    newer one, ensuring the in-memory index always points to the most recent
+    version of the value.
     """    
     def _load_keydir(self):
         
         for filename in sorted(os.listdir(self._dir)):
             if filename.endswith('.dat'):
                 filepath = os.path.join(self._dir, filename)
-                with open(filepath, 'rb') as f:
+                # An empty file cannot be memory-mapped, and has no records anyway.
+                if os.path.getsize(filepath) == 0:
+                    continue
+                file_id = self._add_file(filepath)
+                # Map the whole file once and walk it in memory, instead of issuing
+                # several read/seek syscalls for every record.
+                with open(filepath, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
                     offset = 0
-                    while True:
-                        # Read header: timestamp(4), key size (4), value_size(4)
-                        header = f.read(12)
-                        if not header:
-                            break
-                        #Unpack the header to get the key and value sizes
-                        _, key_size, value_size = struct.unpack('>III', header) 
+                    size = len(mm)
+                    while offset < size:
+                        _, key_size, value_size = HEADER.unpack_from(mm, offset)
                         
-                        key = f.read(key_size).decode('utf-8')
+                        key_start = offset + HEADER.size
+                        key = mm[key_start:key_start + key_size].decode('utf-8')
                         
-                        self._key_dir[key] = (filepath, offset + 12 + key_size, value_size)
-                        f.seek(value_size, 1)
-                        offset = f.tell()  
+                        self._set_location(key, file_id, key_start + key_size, value_size)
+                        offset = key_start + key_size + value_size
     
     """
     Retrieves the value for a given key.
@@ -68,46 +107,117 @@ class Bitcask:
     bytes or None: The value associated with the key, or None if not found.
     """
     def get(self, key):
-        if key not in self._key_dir:
+        slot = self._key_index.get(key)
+        if slot is None:
             return None
         
-        filepath, offset, value_size = self._key_dir[key]
-        with open(filepath, 'rb') as f:
-            f.seek(offset)
-            return f.read(value_size)
+        file_id = self._file_ids[slot]
+        # Recent writes to the active file may still sit in its write buffer.
+        if file_id == self._active_file_id:
+            self._active_file_handle.flush()
+        # pread reads at an explicit offset, so the shared handle needs no seek.
+        f = self._read_handle(file_id)
+        return os.pread(f.fileno(), self._sizes[slot], self._offsets[slot])
+    
+    def _read_handle(self, file_id):
+        """Returns a cached read handle for a data file, opening it if needed."""
+        f = self._read_handles.get(file_id)
+        if f is not None:
+            self._read_handles.move_to_end(file_id)
+            return f
+        
+        f = open(self._files[file_id], 'rb', buffering=0)
+        self._read_handles[file_id] = f
+        # Keep the cache bounded by closing the least recently used handle.
+        if len(self._read_handles) > MAX_READ_HANDLES:
+            _, evicted = self._read_handles.popitem(last=False)
+            evicted.close()
+        return f
         
     def put(self, key, value):
-        if self._active_file is None:
-            self._active_file = self._create_new_file()
+        if self._active_file_handle is None:
+            self._active_file, self._active_file_handle = self._create_new_file()
+            self._active_file_id = self._add_file(self._active_file)
+            self._write_offset = self._active_file_handle.tell()
             
         key_bytes = key.encode('utf-8')    
         key_size = len(key_bytes)
         value_size = len(value)
         
         timestamp = 0
-        header = struct.pack('>III', timestamp, key_size, value_size)
+        header = HEADER.pack(timestamp, key_size, value_size)
         
-        with open(self._active_file, 'ab') as f:
-            offset = f.tell()
-            f.write(header)
-            f.write(key_bytes)
-            f.write(value)
+        # Assemble the whole record up front so it goes out in a single write.
+        record = header + key_bytes + value
+        offset = self._write_offset
+        self._active_file_handle.write(record)
+        self._write_offset += len(record)
             
-        self._key_dir[key] = (self._active_file, offset + 12 + key_size, value_size)     
-        
+        self._set_location(key, self._active_file_id, offset + HEADER.size + key_size, value_size)
+    
+    def _add_file(self, filepath):
+        """Registers a data file and returns its file id."""
+        self._files.append(filepath)
+        return len(self._files) - 1
+    
+    def _set_location(self, key, file_id, offset, value_size):
+        """Points the key directory entry for a key at a new value location."""
+        slot = self._key_index.get(key)
+        if slot is not None:
+            self._file_ids[slot] = file_id
+            self._offsets[slot] = offset
+            self._sizes[slot] = value_size
+        elif self._free_slots:
+            slot = self._free_slots.pop()
+            self._file_ids[slot] = file_id
+            self._offsets[slot] = offset
+            self._sizes[slot] = value_size
+            self._key_index[key] = slot
+        else:
+            self._file_ids.append(file_id)
+            self._offsets.append(offset)
+            self._sizes.append(value_size)
+            self._key_index[key] = len(self._offsets) - 1
     
     def _create_new_file(self):
         
         files = [f for f in os.listdir(self._dir) if f.endswith(".dat")]
         next_id = len(files)
         file_path = os.path.join(self._dir, f"{next_id}.dat")
-        return file_path  
+        # The active file is opened once and kept open for appends, rather than
+        # being reopened on every put.
+        handle = open(file_path, 'ab', buffering=1 << 16)
+        return file_path, handle
     
     def delete(self, key):
         
-        if key in self._key_dir:
+        if key in self._key_index:
             self.put(key, b'')
-            del self._key_dir[key]
+            self._free_slots.append(self._key_index.pop(key))
+    
+    def flush(self, sync=False):
+        """
+        Pushes buffered writes to the operating system, making them visible to
+        other readers of the data files.
+
+        Args:
+        sync (bool): Also fsync the active file, so the writes survive a crash.
+        """
+        if self._active_file_handle is not None:
+            self._active_file_handle.flush()
+            if sync:
+                os.fsync(self._active_file_handle.fileno())
+    
+    def close(self):
+        """Flushes any buffered writes and closes the active file and all read handles."""
+        for f in self._read_handles.values():
+            f.close()
+        self._read_handles.clear()
+        if self._active_file_handle is not None:
+            self._active_file_handle.close()
+            self._active_file_handle = None
+            self._active_file = None
+            self._active_file_id = None
     
 
 # --- Example Usage ---
@@ -129,4 +239,6 @@ if __name__ == '__main__':
 
     # Delete a value
     db.delete("language")
-    print(f"Language after deletion: {db.get('language')}")                                      
\ No newline at end of file
+    print(f"Language after deletion: {db.get('language')}")
+
+    db.close()
\ No newline at end of file
@@ -1,6 +1,12 @@
 import os
-import json
 import time
+import threading
+# To install the MessagePack library: pip install msgpack
+import msgpack
+
+# A unique object used to mark a key as deleted. It is written to disk as None.
+TOMBSTONE = object()
+
 class LSMTree:
     def __init__(self, directory, memtable_threshold=20):
         
@@ -10,37 +16,51 @@ class LSMTree:
         
         self.memtable_threshold = memtable_threshold
         self.memtable = {}
+        # The memtable currently being written to disk by the background flush
+        # thread. It stays readable until its SSTable is visible in _sstables.
+        self._flushing_memtable = None
+        self._flush_thread = None
+        # The exception raised by the last background flush, if it failed.
+        # It is re-raised to the caller by wait_for_flush.
+        self._flush_error = None
         self._sstables = self._load_sstables()
         
     def _load_sstables(self):
-        files = [f for f in os.listdir(self._dir) if f.endswith(".jsonl")]
+        files = [f for f in os.listdir(self._dir) if f.endswith(".sst")]
         return sorted(files, reverse=True)    
     
     def delete(self, key):
         """
         Deletes a key by writing a special "tombstone" marker.
         """
-        self.put(key, "")
+        self.put(key, TOMBSTONE)
     
     def put(self, key, value):
         self.memtable[key] = value
-        if len(self.memtable) > self.memtable_threshold:
-            self._flush
+        if len(self.memtable) >= self.memtable_threshold:
+            self._flush()
     
     ## This becomes super slow at the current implementation
     def get(self, key):
-        if self.memtable[key] is not None:
-            return self.memtable[key]
+        if key in self.memtable:
+            value = self.memtable[key]
+            return None if value is TOMBSTONE else value
+        
+        flushing_memtable = self._flushing_memtable
+        if flushing_memtable is not None and key in flushing_memtable:
+            value = flushing_memtable[key]
+            return None if value is TOMBSTONE else value
         
         for sstable_file in self._sstables:
             filepath = os.path.join(self._dir, sstable_file)
+            # Stream the file through the unpacker, which reads it in large
+            # chunks. MessagePack records are self-delimiting, so it walks them
+            # without any line framing, and the file never has to fit in memory.
             with open(filepath, 'rb') as f:
-                for line in f:
-                    record = json.loads(line)
-                    if record[key] == key:
-                        if record['value'] is None:
-                            return None
-                        return record['value']
+                for record_key, value in msgpack.Unpacker(f):
+                    if record_key == key:
+                        # A tombstone is stored as None, so a deleted key reads as None.
+                        return value
         return None   
     
     def _flush(self):
@@ -48,21 +68,75 @@ class LSMTree:
         if not self.memtable:
             return
         
+        # Only one flush runs at a time, so wait for the previous one to finish
+        # before handing it another memtable.
+        self.wait_for_flush()
+        
+        # Swap in a fresh memtable so puts can carry on while the full one is
+        # sorted and written to disk in the background.
+        self._flushing_memtable, self.memtable = self.memtable, {}
+        self._flush_thread = threading.Thread(
+            target=self._run_flush, args=(self._flushing_memtable,))
+        self._flush_thread.start()
+    
+    def wait_for_flush(self):
+        """
+        Blocks until the background flush, if any, has finished.
+
+        If that flush failed, its memtable is merged back under the current one,
+        so none of its writes are lost, and the flush's exception is re-raised.
+        """
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+        
+        error, self._flush_error = self._flush_error, None
+        if error is not None:
+            # Newer writes in the current memtable take precedence.
+            failed_memtable = self._flushing_memtable
+            failed_memtable.update(self.memtable)
+            self.memtable = failed_memtable
+            self._flushing_memtable = None
+            raise error
+    
+    def close(self):
+        """
+        Waits for the background flush to finish. Writes still in the memtable
+        are not flushed.
+        """
+        self.wait_for_flush()
+    
+    def _run_flush(self, memtable):
+        # An exception would otherwise end the thread silently. Keep it for
+        # wait_for_flush, and keep the memtable readable until then.
+        try:
+            self._flush_to_disk(memtable)
+        except Exception as e:
+            self._flush_error = e
+    
+    def _flush_to_disk(self, memtable):
+        
         timestamp = int(time.time() * 1_000_000)
-        file_name = f"{timestamp}.jsonl"
+        file_name = f"{timestamp}.sst"
         file_path = os.path.join(self._dir, file_name)
         
-        sorted_items = sorted(self.memtable.items())
-        with open (file_path, 'w') as f:
-            for key, value in sorted_items:
-                json_value = None if value == "$" else value
-                record = {'key': key, 'value': json_value}
-                f.write(json.dumps(record + '\n'))
+        sorted_items = sorted(memtable.items())
+        # Each record is a MessagePack (key, value) pair, with None as the
+        # tombstone value. No field names are stored, unlike a JSON object.
+        packer = msgpack.Packer()
+        buf = bytearray()
+        for key, value in sorted_items:
+            stored_value = None if value is TOMBSTONE else value
+            buf += packer.pack((key, stored_value))
+        with open (file_path, 'wb') as f:
+            f.write(buf)
                 
-        print("Flushed memtable to {file_name}")
+        print(f"Flushed memtable to {file_name}")
         
+        # Publish the SSTable before dropping the flushing memtable, so a
+        # concurrent get always finds the data in one of the two.
         self._sstables.insert(0, file_name)
-        self.memtable.clear        
+        self._flushing_memtable = None
                  
         
                       
@@ -81,6 +155,7 @@ if __name__ == '__main__':
     print("\n--- Adding 4th element to trigger flush ---")
     db.put("job", "Engineer")
     print("Memtable is now empty:", db.memtable)
+    db.wait_for_flush()
     print("Current SSTables:", db._sstables)
 
     # Add more data, this time updating a key
@@ -91,6 +166,7 @@ if __name__ == '__main__':
     # This will trigger another flush
     print("\n--- Adding 8th element to trigger flush ---")
     db.put("system", "LSMTree") 
+    db.wait_for_flush()
     print("Current SSTables:", db._sstables)
     
     # Demonstrate reads
@@ -108,8 +184,10 @@ if __name__ == '__main__':
     db.put("a","1")
     db.put("b","2")
     db.put("c","3") # This should trigger the final flush
+    db.wait_for_flush()
     print("\n--- Final State ---")
     print("Memtable:", db.memtable)
     print("SSTables:", db._sstables)
     print(f"Language should still be None after flush: {db.get('language')}")
+    db.close()
         
\ No newline at end of file
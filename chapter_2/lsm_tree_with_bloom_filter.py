@@ -1,8 +1,13 @@
 import os
-import json
+import bisect
+import math
+import mmap
+import pickle
+import struct
 import time
-# To install the bloom filter library: pip install pybloom-live
-from pybloom_live import BloomFilter
+# To install the bloom filter and JIT dependencies: pip install numpy mmh3 numba
+import mmh3
+import numpy as np
 
 # --- Design Constants ---
 
@@ -16,6 +21,166 @@ TOMBSTONE = object()
 SSTABLE_EXTENSION = ".sst"
 # The file extension for our Bloom Filter files.
 BLOOM_FILTER_EXTENSION = ".bf"
+# The file extension for our persisted index files. They hold every key of an
+# SSTable (as UTF-8 bytes) together with its record offset, from which the
+# sparse and block indexes are rebuilt at startup without scanning the SSTable.
+INDEX_EXTENSION = ".idx"
+
+# The header of every SSTable record: a tombstone flag (1 byte), followed by the
+# key length and value length (4 bytes each). The raw UTF-8 key and value bytes
+# come right after it. Length-prefixed records need no escaping or parsing,
+# unlike a text format such as JSON lines.
+REC_HDR = struct.Struct('>BII')
+# Its size, as a plain int that Numba compiles into _scan_records as a constant.
+REC_HDR_SIZE = REC_HDR.size
+
+def _scan_records(buf, end):
+    """
+    Walks the SSTable records in buf[0:end] and returns the start offset and the
+    key length of every complete record, as two NumPy arrays. A truncated record
+    at the tail of the file, e.g. from a crash mid-write, is ignored.
+
+    This is the tightest loop in the module, so it is compiled with Numba (see
+    _compiled_scan_records). The big-endian header fields are decoded by hand,
+    which leaves nothing but integer arithmetic on a byte array inside the loop.
+    Compiled code does no bounds checking, so every read is checked against end.
+    """
+    # Every record takes at least a full header, which bounds the record count.
+    max_records = end // REC_HDR_SIZE + 1
+    offsets = np.empty(max_records, dtype=np.int64)
+    key_sizes = np.empty(max_records, dtype=np.int64)
+    count = 0
+    off = 0
+    while off + REC_HDR_SIZE <= end:
+        key_size = ((np.int64(buf[off + 1]) << 24) | (np.int64(buf[off + 2]) << 16)
+                    | (np.int64(buf[off + 3]) << 8) | np.int64(buf[off + 4]))
+        value_size = ((np.int64(buf[off + 5]) << 24) | (np.int64(buf[off + 6]) << 16)
+                      | (np.int64(buf[off + 7]) << 8) | np.int64(buf[off + 8]))
+        if off + REC_HDR_SIZE + key_size + value_size > end:
+            break
+        offsets[count] = off
+        key_sizes[count] = key_size
+        count += 1
+        off += REC_HDR_SIZE + key_size + value_size
+    return offsets[:count], key_sizes[:count]
+
+# The Numba-compiled version of _scan_records. It is only needed for SSTables
+# without an index file, so Numba is imported and the scanner compiled on first use.
+_scan_records_jit = None
+
+def _compiled_scan_records():
+    global _scan_records_jit
+    if _scan_records_jit is None:
+        from numba import njit
+        _scan_records_jit = njit(cache=True)(_scan_records)
+    return _scan_records_jit
+
+# Below this many candidate SSTables, `get` checks their Bloom Filters one by
+# one, which is cheaper than the fixed overhead of a vectorized NumPy pass.
+# Measured, the batch only pulls ahead of lazy scalar checks at around 32.
+MIN_BATCH_BLOOM_CHECKS = 32
+
+# The header of a Bloom Filter file: the number of bits (m) and the number of
+# hash functions (k). The bit array itself follows as raw bytes.
+BLOOM_HDR = struct.Struct('>QI')
+
+# Double hashing is done in unsigned 64-bit arithmetic, so results wrap around
+# exactly like NumPy uint64 math does in the tree's batched Bloom check.
+_UINT64_MASK = (1 << 64) - 1
+
+class BloomFilter:
+    """
+    A Bloom Filter backed by a bytearray, where bit b lives in byte b >> 3.
+
+    Each key is hashed once with the C-implemented 128-bit MurmurHash3, and the
+    two 64-bit halves (h1, h2) generate all k probe positions through double
+    hashing: position_i = (h1 + i * h2) mod m. With k around 7, plain integer
+    math on a bytearray beats building a NumPy array for every key.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        """
+        Sizes the filter for the expected number of keys and false positive rate.
+
+        Args:
+            capacity (int): The number of keys the filter is expected to hold.
+            error_rate (float): The desired false positive probability.
+        """
+        capacity = max(capacity, 1)
+        # Standard optimal sizing: m = -n*ln(p) / ln(2)^2, k = -log2(p).
+        # k depends only on the error rate, so every filter built with the same
+        # rate probes the same number of bits, whatever its capacity.
+        num_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        # Round up to a whole number of 64-bit words.
+        num_bits = (num_bits + 63) // 64 * 64
+        num_hashes = max(1, round(-math.log2(error_rate)))
+        self._init(num_bits, num_hashes, bytearray(num_bits // 8))
+
+    def _init(self, num_bits, num_hashes, bits):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits
+
+    @staticmethod
+    def hash_key(key):
+        """
+        Returns the (h1, h2) pair of unsigned 64-bit hashes of a key.
+
+        mmh3 hashes a str as its UTF-8 encoding, so a key and its UTF-8 bytes
+        hash identically and may be used interchangeably.
+        """
+        return mmh3.hash64(key, signed=False)
+
+    def add(self, key):
+        h1, h2 = mmh3.hash64(key, signed=False)
+        bits = self.bits
+        num_bits = self.num_bits
+        combined = h1
+        for _ in range(self.num_hashes):
+            position = combined % num_bits
+            bits[position >> 3] |= 1 << (position & 7)
+            combined = (combined + h2) & _UINT64_MASK
+
+    def add_many(self, keys):
+        """
+        Adds many keys at once: every key is hashed in one pass, then the probe
+        positions of all keys are computed and set in single NumPy operations.
+        """
+        hashes = np.array([mmh3.hash64(key, signed=False) for key in keys],
+                          dtype=np.uint64).reshape(-1, 2)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        # One row of k probe positions per key; uint64 math wraps like add's.
+        positions = (hashes[:, :1] + steps * hashes[:, 1:]) % np.uint64(self.num_bits)
+        masks = (np.uint64(1) << (positions & np.uint64(7))).astype(np.uint8)
+        # bitwise_or.at applies every update, even when positions repeat.
+        np.bitwise_or.at(np.frombuffer(self.bits, dtype=np.uint8),
+                         positions >> np.uint64(3), masks)
+
+    def __contains__(self, key):
+        h1, h2 = mmh3.hash64(key, signed=False)
+        bits = self.bits
+        num_bits = self.num_bits
+        combined = h1
+        for _ in range(self.num_hashes):
+            position = combined % num_bits
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            combined = (combined + h2) & _UINT64_MASK
+        return True
+
+    def tofile(self, f):
+        """Writes the filter to an open binary file."""
+        f.write(BLOOM_HDR.pack(self.num_bits, self.num_hashes))
+        f.write(self.bits)
+
+    @classmethod
+    def fromfile(cls, f):
+        """Reads a filter previously written with `tofile`."""
+        num_bits, num_hashes = BLOOM_HDR.unpack(f.read(BLOOM_HDR.size))
+        bits = bytearray(f.read(num_bits // 8))
+        bloom_filter = cls.__new__(cls)
+        bloom_filter._init(num_bits, num_hashes, bits)
+        return bloom_filter
 
 class LSMTree:
     """
@@ -27,11 +192,13 @@ class LSMTree:
     - Tombstones for handling deletions.
     - A multi-layered read path that checks memory before disk.
 
-    It also includes two critical optimizations for read performance:
+    It also includes three critical optimizations for read performance:
     1.  Bloom Filters: To quickly determine if a key *does not* exist in an SSTable,
         avoiding unnecessary disk reads.
     2.  Sparse Indexes: To find the approximate location of a key within an SSTable,
         drastically reducing the amount of data that needs to be scanned on disk.
+    3.  Block Indexes: To binary-search the block found by the sparse index, so a
+        lookup decodes exactly one record even when blocks are large.
     """
 
     def __init__(self, directory, memtable_threshold=10, sparse_index_granularity=2):
@@ -60,18 +227,50 @@ class LSMTree:
         
         # --- In-Memory Indexes for Read Optimization ---
         # These data structures are held in memory to make reads faster. They are
-        # rebuilt at startup by scanning the files on disk.
+        # loaded at startup from the index files persisted next to each SSTable.
+
+        # The smallest and largest key of each SSTable, as UTF-8 bytes.
+        # Maps sstable_filename -> (min_key, max_key).
+        self._key_ranges = {}
 
         # A cache for Bloom Filters, one for each SSTable.
         # Maps sstable_filename -> BloomFilter object.
         self._bloom_filters = {}
 
-        # A cache for Sparse Indexes.
-        # Maps sstable_filename -> sparse_index_dictionary.
-        self._sparse_indexes = {}
+        # The bit arrays of all Bloom Filters packed into a single array, so `get`
+        # can probe many filters at once. Filters are appended as SSTables are
+        # added (see _append_bloom_filter), and the array grows by doubling.
+        # Maps sstable_filename -> byte offset of its filter in the array.
+        self._bloom_bytes = np.zeros(0, dtype=np.uint8)
+        self._bloom_used = 0
+        self._bloom_offsets = {}
+
+        # Each filter's position, size and hash count in the packed array,
+        # ordered like _sstables. Rebuilt by _refresh_read_path.
+        self._bloom_bases = None
+        self._bloom_sizes = None
+        self._bloom_steps = None
+        self._bloom_unused_probes = None
+
+        # A lookup function for each SSTable, built by _make_probe. It holds the
+        # SSTable's key range, Sparse Index and Block Indexes in its closure.
+        # Maps sstable_filename -> probe function.
+        self._sstable_probes = {}
+
+        # The same key ranges, Bloom Filters and probe functions, ordered like
+        # _sstables, for the read path.
+        self._ordered_key_ranges = []
+        self._ordered_bloom_filters = []
+        self._probes = []
+
+        # Long-lived memory maps of the SSTable files, so reads don't have to open
+        # the file on every lookup and hot SSTables are served from the page cache.
+        # Maps sstable_filename -> mmap object.
+        self._sstable_mmaps = {}
         
         # A list of SSTable file paths, kept sorted from newest to oldest.
         self._sstables = self._load_from_disk()
+        self._refresh_read_path()
 
     def _load_from_disk(self):
         """
@@ -84,41 +283,189 @@ class LSMTree:
         sstables = []
         for filename in os.listdir(self._dir):
             if filename.endswith(SSTABLE_EXTENSION):
+                # A crash mid-flush can leave an empty SSTable behind. It holds no
+                # records, and an empty file cannot be memory-mapped anyway.
+                if os.path.getsize(os.path.join(self._dir, filename)) == 0:
+                    continue
                 sstable_name = filename.replace(SSTABLE_EXTENSION, "")
                 sstables.append(sstable_name)
 
                 # Load the corresponding Bloom Filter into memory.
                 bloom_filter_path = os.path.join(self._dir, sstable_name + BLOOM_FILTER_EXTENSION)
                 with open(bloom_filter_path, 'rb') as f:
-                    self._bloom_filters[sstable_name] = BloomFilter.fromfile(f)
-
-                # Rebuild the sparse index from the SSTable file.
-                self._sparse_indexes[sstable_name] = self._rebuild_sparse_index(sstable_name)
+                    self._append_bloom_filter(sstable_name, BloomFilter.fromfile(f))
+
+                self._sstable_mmaps[sstable_name] = self._map_sstable(sstable_name)
+
+                # Load the persisted index. SSTables written before index files
+                # existed don't have one, so fall back to scanning the SSTable.
+                index_path = os.path.join(self._dir, sstable_name + INDEX_EXTENSION)
+                if os.path.exists(index_path):
+                    with open(index_path, 'rb') as f:
+                        record_keys, record_offsets = pickle.load(f)
+                    # Older index files hold the keys as strings; encode them so
+                    # they compare with the bytes keys used everywhere else.
+                    if isinstance(record_keys[0], str):
+                        record_keys = [key.encode('utf-8') for key in record_keys]
+                else:
+                    record_keys, record_offsets = self._scan_sstable(sstable_name)
+                # The keys are sorted, so the first and last ones bound the SSTable.
+                self._key_ranges[sstable_name] = (record_keys[0], record_keys[-1])
+                self._sstable_probes[sstable_name] = self._make_probe(
+                    self._sstable_mmaps[sstable_name], record_keys, record_offsets)
 
         # Sort by the timestamp in the filename in descending order (newest first).
         # This is crucial for the read path, ensuring we always find the most
         # recent version of a key first.
         return sorted(sstables, reverse=True)
     
-    def _rebuild_sparse_index(self, sstable_name):
-        """Recreates the sparse index for a given SSTable by scanning it."""
-        sparse_index = {}
+    def _refresh_read_path(self):
+        """
+        Rebuilds the read-path structures that follow the order of `_sstables`.
+        Must be called whenever the list of SSTables changes.
+
+        Only per-SSTable metadata is rebuilt here; the Bloom Filter bits stay
+        where _append_bloom_filter put them.
+        """
+        self._ordered_key_ranges = [self._key_ranges[name] for name in self._sstables]
+        self._probes = [self._sstable_probes[name] for name in self._sstables]
+
+        filters = [self._bloom_filters[name] for name in self._sstables]
+        self._ordered_bloom_filters = filters
+        self._bloom_bases = np.array([self._bloom_offsets[name] * 8 for name in self._sstables],
+                                     dtype=np.uint64)[:, None]
+        self._bloom_sizes = np.array([bloom_filter.num_bits for bloom_filter in filters],
+                                     dtype=np.uint64)[:, None]
+
+        # Filters may use different numbers of hash functions. Probe them all with
+        # the largest count and ignore each filter's extra probes.
+        num_hashes = np.array([bloom_filter.num_hashes for bloom_filter in filters])
+        self._bloom_steps = np.arange(num_hashes.max(initial=0), dtype=np.uint64)
+        self._bloom_unused_probes = self._bloom_steps[None, :] >= num_hashes[:, None]
+
+    def _append_bloom_filter(self, sstable_name, bloom_filter):
+        """
+        Copies a Bloom Filter's bits to the end of the packed array and points the
+        filter at its slice of it, so the bits aren't held in memory twice.
+        """
+        size = bloom_filter.num_bits // 8
+        offset = self._bloom_used
+        if offset + size > len(self._bloom_bytes):
+            # Double the capacity, so appending N filters copies O(N) bits in total.
+            grown = np.zeros(max(2 * len(self._bloom_bytes), offset + size), dtype=np.uint8)
+            grown[:offset] = self._bloom_bytes[:offset]
+            self._bloom_bytes = grown
+            for name, existing in self._bloom_filters.items():
+                start = self._bloom_offsets[name]
+                existing.bits = memoryview(grown[start:start + existing.num_bits // 8])
+
+        self._bloom_bytes[offset:offset + size] = np.frombuffer(bloom_filter.bits, dtype=np.uint8)
+        bloom_filter.bits = memoryview(self._bloom_bytes[offset:offset + size])
+        self._bloom_used = offset + size
+        self._bloom_offsets[sstable_name] = offset
+        self._bloom_filters[sstable_name] = bloom_filter
+
+    def _bloom_check_all(self, key, rows):
+        """
+        Probes the Bloom Filters of the given SSTables for a key in one pass.
+
+        Args:
+            key (bytes): The UTF-8 encoded key.
+            rows (list): Positions in `_sstables` of the SSTables to check.
+
+        Returns:
+            A boolean NumPy array aligned with `rows`: False means the key is
+            definitely not in that SSTable.
+        """
+        # Skip the fancy indexing when every SSTable is a candidate.
+        rows = slice(None) if len(rows) == len(self._sstables) else np.array(rows)
+        h1, h2 = BloomFilter.hash_key(key)
+        # The hash is computed once; only the final `mod m` differs per filter.
+        # One row of probe positions per filter, offset into the packed array.
+        raw_positions = np.uint64(h1) + self._bloom_steps * np.uint64(h2)
+        positions = raw_positions[None, :] % self._bloom_sizes[rows] + self._bloom_bases[rows]
+        packed = self._bloom_bytes[positions >> np.uint64(3)]
+        is_set = ((packed >> (positions & np.uint64(7)).astype(np.uint8)) & 1).astype(bool)
+        return np.all(is_set | self._bloom_unused_probes[rows], axis=1)
+
+    def _map_sstable(self, sstable_name):
+        """Memory-maps an SSTable file for reading."""
         sstable_path = os.path.join(self._dir, sstable_name + SSTABLE_EXTENSION)
-        offset = 0
-        entry_count = 0
-        with open(sstable_path, 'r') as f:
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                
-                if entry_count % self.sparse_index_granularity == 0:
-                    record = json.loads(line)
-                    sparse_index[record['key']] = offset
-                
-                offset = f.tell()
-                entry_count += 1
-        return sparse_index
+        # The mmap keeps its own reference to the file, so we can close ours.
+        with open(sstable_path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _scan_sstable(self, sstable_name):
+        """
+        Recovers every key of an SSTable and its record offset by scanning it.
+
+        Returns:
+            A (record_keys, record_offsets) tuple of two parallel lists. The keys
+            are the raw UTF-8 bytes stored in the SSTable.
+        """
+        mm = self._sstable_mmaps[sstable_name]
+        # Find every record with the compiled scanner, then slice out just the keys.
+        offsets, key_sizes = _compiled_scan_records()(np.frombuffer(mm, dtype=np.uint8), len(mm))
+        record_offsets = offsets.tolist()
+        record_keys = [
+            mm[offset + REC_HDR.size:offset + REC_HDR.size + key_size]
+            for offset, key_size in zip(record_offsets, key_sizes.tolist())
+        ]
+        return record_keys, record_offsets
+
+    def _make_probe(self, mm, record_keys, record_offsets):
+        """
+        Builds the lookup function for one SSTable from the sorted list of its
+        UTF-8 encoded keys and their record offsets.
+
+        Everything a lookup needs (the Sparse Index, Block Indexes and the memory
+        map) is captured in the closure, so probing an SSTable is a single call
+        with no attribute or dictionary lookups on the tree. Keys are kept as
+        bytes, so every comparison in the binary searches is a plain memcmp.
+        UTF-8 preserves ordering, so the bytes sort like the strings.
+
+        Returns:
+            A function taking a UTF-8 encoded key and returning None if the
+            SSTable doesn't hold it, or an (is_tombstone, value_bytes) tuple if
+            it does.
+        """
+        granularity = self.sparse_index_granularity
+        # Sample every Nth key for our sparse index; each sample starts a block
+        # whose keys and record offsets are kept for binary search.
+        sparse_keys = record_keys[::granularity]
+        blocks = [
+            (record_keys[i:i + granularity], record_offsets[i:i + granularity])
+            for i in range(0, len(record_keys), granularity)
+        ]
+
+        bisect_left = bisect.bisect_left
+        bisect_right = bisect.bisect_right
+        unpack_header = REC_HDR.unpack_from
+        header_size = REC_HDR.size
+
+        def probe(key):
+            # --- Sparse Index Lookup ---
+            # The largest sampled key that is less than or equal to the target key
+            # starts the only block that can hold the key.
+            block = bisect_right(sparse_keys, key) - 1
+            if block < 0:
+                return None # The key sorts before everything in this SSTable
+            block_keys, block_offsets = blocks[block]
+
+            # --- Block Index Lookup ---
+            # The block's keys are sorted too, so instead of scanning it record by
+            # record we binary-search its key list for the exact record offset.
+            i = bisect_left(block_keys, key)
+            if i == len(block_keys) or block_keys[i] != key:
+                return None # Not in this SSTable (a Bloom Filter false positive)
+
+            # Decode exactly one record from the memory-mapped file.
+            offset = block_offsets[i]
+            is_tombstone, key_size, value_size = unpack_header(mm, offset)
+            value_start = offset + header_size + key_size
+            return is_tombstone, mm[value_start:value_start + value_size]
+
+        return probe
 
     def put(self, key, value):
         """
@@ -127,7 +474,15 @@ class LSMTree:
         First writes to the in-memory Memtable. If the Memtable exceeds its
         threshold, it's flushed to a new SSTable on disk. This is the "Log"
         part of the "Log-Structured" name, as writes are buffered.
+
+        Both keys and values are strings; they are stored on disk as UTF-8.
         """
+        # Reject other types here: once in the memtable, a bad entry would make
+        # every later flush fail.
+        if not isinstance(key, str):
+            raise TypeError(f"key must be a str, not {type(key).__name__}")
+        if not isinstance(value, str) and value is not TOMBSTONE:
+            raise TypeError(f"value must be a str, not {type(value).__name__}")
         self.memtable[key] = value
         if len(self.memtable) >= self.memtable_threshold:
             self._flush()
@@ -151,56 +506,52 @@ class LSMTree:
             return None if value is TOMBSTONE else value
 
         # --- Layer 2: Check On-Disk SSTables (from newest to oldest) ---
-        for sstable_name in self._sstables:
-            # --- Optimization 1: Bloom Filter Check ---
-            # Ask the Bloom Filter if the key *might* be in this file.
-            # If it returns False, the key is *definitely not* in this SSTable.
-            # This allows us to completely skip a disk read for this file, which is a
-            # massive performance win for non-existent keys.
-            if key not in self._bloom_filters[sstable_name]:
+        if not self._sstables:
+            return None
+
+        # SSTable keys are indexed as UTF-8 bytes, so encode the target key once.
+        key_bytes = key.encode('utf-8')
+
+        # --- Optimization 1: Key Range Check ---
+        # A key outside an SSTable's [min_key, max_key] range can't be in it.
+        # This costs two byte string comparisons, which is cheaper than hashing
+        # the key for the Bloom Filter, so it is done before touching the Bloom
+        # Filters at all.
+        rows = [i for i, (min_key, max_key) in enumerate(self._ordered_key_ranges)
+                if min_key <= key_bytes <= max_key]
+        if not rows:
+            return None
+
+        # --- Optimization 2: Bloom Filter Check ---
+        # Ask the Bloom Filters of the remaining SSTables if the key *might* be in
+        # their files. If a filter says False, the key is *definitely not* in
+        # that SSTable. This allows us to completely skip a disk read for that
+        # file, which is a massive performance win for non-existent keys.
+        # Many filters are checked in a single vectorized pass; a few are checked
+        # lazily one at a time, so a hit in a new SSTable skips the older ones.
+        if len(rows) < MIN_BATCH_BLOOM_CHECKS:
+            bloom_filters = self._ordered_bloom_filters
+            might_contain = (key_bytes in bloom_filters[row] for row in rows)
+        else:
+            might_contain = self._bloom_check_all(key_bytes, rows).tolist()
+        probes = self._probes
+        for row, maybe_here in zip(rows, might_contain):
+            if not maybe_here:
                 continue # Skip to the next SSTable
 
-            # --- Optimization 2: Sparse Index Lookup ---
-            # If the Bloom Filter gave a potential positive, we use the sparse index
-            # to find the small "block" on disk where the key *should* be.
-            start_offset = self._find_block_offset(sstable_name, key)
-            
-            # Now, we only need to scan this small block instead of the whole file.
-            sstable_path = os.path.join(self._dir, sstable_name + SSTABLE_EXTENSION)
-            with open(sstable_path, 'r') as f:
-                f.seek(start_offset)
-                for line in f:
-                    record = json.loads(line)
-                    # Since SSTables are sorted, if we see a key that is alphabetically
-                    # greater than our target key, we know the target key is not in this
-                    # file. We can stop scanning this block early.
-                    if record['key'] > key:
-                        break # Short-circuit scan
-                    
-                    if record['key'] == key:
-                        # Found the key. If it's a tombstone, it's deleted.
-                        return None if record['value'] is None else record['value']
+            # --- Optimization 3: Indexed Lookup ---
+            # The SSTable's probe uses the sparse and block indexes to decode
+            # exactly one record, if the key is there.
+            record = probes[row](key_bytes)
+            if record is not None:
+                is_tombstone, value = record
+                # Found the key. If it's a tombstone, it's deleted.
+                return None if is_tombstone else value.decode('utf-8')
 
         # --- Layer 3: Not Found ---
         # If the key wasn't found in the memtable or any SSTable, it doesn't exist.
         return None
     
-    def _find_block_offset(self, sstable_name, key):
-        """
-        Uses the sparse index to find the starting disk offset for the block
-        containing the given key.
-        """
-        sparse_index = self._sparse_indexes[sstable_name]
-        
-        # Find the largest key in the sparse index that is less than or equal to the target key.
-        # This gives us the starting point of the block to scan.
-        relevant_keys = [k for k in sparse_index.keys() if k <= key]
-        if not relevant_keys:
-            return 0 # Scan from the beginning of the file
-        
-        start_key = max(relevant_keys)
-        return sparse_index[start_key]
-
     def delete(self, key):
         """
         Deletes a key by writing a special "tombstone" marker.
@@ -231,24 +582,32 @@ class LSMTree:
         # Prepare the Bloom Filter for this new SSTable.
         # We need to estimate the capacity and a desired error rate.
         bloom_filter = BloomFilter(capacity=len(sorted_items), error_rate=0.01)
-        sparse_index = {}
-
-        with open(sstable_path, 'w') as f:
-            entry_count = 0
-            for key, value in sorted_items:
-                # Add the key to our Bloom Filter.
-                bloom_filter.add(key)
-
-                current_offset = f.tell()
-                # Sample every Nth key for our sparse index.
-                if entry_count % self.sparse_index_granularity == 0:
-                    sparse_index[key] = current_offset
-                
-                # Use `None` in JSON to represent our TOMBSTONE object.
-                json_value = None if value is TOMBSTONE else value
-                record = {'key': key, 'value': json_value}
-                f.write(json.dumps(record) + '\n')
-                entry_count += 1
+        # Add all of the memtable's keys to it in a single batch.
+        bloom_filter.add_many(self.memtable)
+
+        # The keys are already sorted, so these lists come out in index order.
+        record_keys = []
+        record_offsets = []
+
+        # Build the whole SSTable in memory and write it out with a single call.
+        buf = bytearray()
+        for key, value in sorted_items:
+            key_bytes = key.encode('utf-8')
+            record_keys.append(key_bytes)
+            record_offsets.append(len(buf))
+            
+            # A tombstone is written as an empty value with its flag set.
+            if value is TOMBSTONE:
+                buf += REC_HDR.pack(1, len(key_bytes), 0)
+                buf += key_bytes
+            else:
+                value_bytes = value.encode('utf-8')
+                buf += REC_HDR.pack(0, len(key_bytes), len(value_bytes))
+                buf += key_bytes
+                buf += value_bytes
+
+        with open(sstable_path, 'wb') as f:
+            f.write(buf)
                 
         print(f"Flushed Memtable to {sstable_name}{SSTABLE_EXTENSION}")
         
@@ -259,16 +618,31 @@ class LSMTree:
         with open(bloom_filter_path, 'wb') as f:
             bloom_filter.tofile(f)
 
+        # Save the key index, so startup doesn't have to scan the SSTable.
+        index_path = os.path.join(self._dir, sstable_name + INDEX_EXTENSION)
+        with open(index_path, 'wb') as f:
+            pickle.dump((record_keys, record_offsets), f, protocol=pickle.HIGHEST_PROTOCOL)
+
         # --- Update Live In-Memory State ---
         
         # Add the new SSTable to our list (at the front, since it's the newest).
         self._sstables.insert(0, sstable_name)
         # Cache the new indexes in memory for immediate use.
-        self._bloom_filters[sstable_name] = bloom_filter
-        self._sparse_indexes[sstable_name] = sparse_index
+        self._append_bloom_filter(sstable_name, bloom_filter)
+        self._key_ranges[sstable_name] = (record_keys[0], record_keys[-1])
+        self._sstable_mmaps[sstable_name] = self._map_sstable(sstable_name)
+        self._sstable_probes[sstable_name] = self._make_probe(
+            self._sstable_mmaps[sstable_name], record_keys, record_offsets)
+        self._refresh_read_path()
         
         # Clear the memtable to accept new writes.
-        self.memtable.clear()       
+        self.memtable.clear()
+
+    def close(self):
+        """Unmaps all SSTable files. The tree must not be used afterwards."""
+        for mm in self._sstable_mmaps.values():
+            mm.close()
+        self._sstable_mmaps.clear()
                  
 # --- Example Usage ---
 if __name__ == '__main__':
@@ -323,4 +697,6 @@ if __name__ == '__main__':
     print("\n--- Final State ---")
     print("Memtable is now empty:", db.memtable)
     print("SSTables:", db._sstables)
-    print(f"Language should still be None after flush: {db.get('language')}")
\ No newline at end of file
+    print(f"Language should still be None after flush: {db.get('language')}")
+
+    db.close()
\ No newline at end of file